@@ -1,23 +1,77 @@
+import asyncio
 import yfinance as yf
+import numpy as np
 import pandas as pd
+import lxml.html
 import json
+import logging
+import orjson
 import datetime
+import functools
+import hashlib
+import os
+import sqlite3
 import sys
+import tempfile
+import time
 import requests
-import traceback
 from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+from contextlib import closing
+from operator import itemgetter
+
+logger = logging.getLogger(__name__)
 
 # --- FILTRES ET CRITÈRES BUFFETT ---
 
 # Secteurs exclus (Qualitatif)
-EXCLUDED_SECTORS = [
+EXCLUDED_SECTORS = frozenset({
     'Technology', 'Biotechnology', 'Basic Materials', 'Energy', 
     'Oil & Gas', 'Mining', 'Semiconductors', 'Aerospace & Defense', 
     'Capital Goods', 'Industrials', 'Real Estate', 'Telecommunication Services' 
-]
+})
 
 # Secteurs exemptés du critère strict de Dette (Banques, Utilities)
-EXEMPTED_DEBT_SECTORS = ['Financial Services', 'Utilities']
+EXEMPTED_DEBT_SECTORS = frozenset({'Financial Services', 'Utilities'})
+
+# Jeu de critères d'un screening (les seuils des ratios sont exclusifs)
+FilterSpec = namedtuple("FilterSpec", "max_pe min_roe min_gpm max_de excluded_sectors exempted_debt_sectors")
+
+BUFFETT_FILTERS = FilterSpec(
+    max_pe=25, # CRITÈRE P/E < 25
+    min_roe=0.15, min_gpm=0.20, max_de=1.0,
+    excluded_sectors=EXCLUDED_SECTORS, exempted_debt_sectors=EXEMPTED_DEBT_SECTORS
+)
+
+# Travail purement réseau (I/O) : on peut dépasser largement le nombre de CPU.
+# Réglable (SCREENER_CONCURRENCY) selon la tolérance de Yahoo au rate-limit.
+def env_workers(name, default):
+    """Entier >= 1 lu dans l'environnement ; valeur vide ou invalide : default."""
+    raw = os.environ.get(name, "").strip()
+    if not raw: return default
+    try:
+        value = int(raw)
+    except ValueError:
+        logger.warning("%s=%r n'est pas un entier, valeur par défaut %d", name, raw, default)
+        return default
+    if value < 1: logger.warning("%s=%d ramené à 1", name, value)
+    return max(1, value)
+
+MAX_WORKERS = env_workers("SCREENER_CONCURRENCY", 16)
+# Délai max par action : une action bloquée (rate-limit Yahoo) ne retient pas le lot
+TICKER_TIMEOUT = 15 # secondes
+# Cours des actions en cache : un seul yf.download (historique 5 jours) par lot
+PRICE_BATCH = 50
+
+# Cache disque des listes Wikipedia (la composition des indices change peu)
+CACHE_DIR = os.path.expanduser("~/.cache/bourseradar")
+WIKI_CACHE_TTL = 7 * 86400 # 7 jours
+
+# Cache SQLite des fondamentaux par action (les états financiers changent 4 fois par an)
+FUNDAMENTALS_DB = os.path.join(CACHE_DIR, "fundamentals.db")
+FUNDAMENTALS_TTL = 86400 # 24 h
+SECTOR_TTL = 30 * 86400 # le secteur d'une action ne change presque jamais
+FUNDAMENTAL_FIELDS = ("symbol", "name", "sector", "pe", "roe", "gpm", "de_ratio", "currency")
 
 # --- 1. FONCTIONS DE CALCUL ET DE SÉCURITÉ ---
 
@@ -28,92 +82,151 @@ def get_safe_float(info, key, reject_value):
     except:
         return reject_value
 
-def calculate_roe(stock):
-    try:
-        financials = stock.financials
-        balance = stock.balance_sheet
-        if financials.empty or balance.empty: return -1.0
-        
-        net_income = financials.loc['Net Income'].iloc[0]
-        equity = balance.loc['Total Stockholder Equity'].iloc[0]
-        return net_income / equity if equity > 0 else -1.0
-    except:
-        return -1.0
+def canon(value):
+    """Partage une seule instance des chaînes très répétées (secteur, devise, tag)."""
+    return sys.intern(value) if isinstance(value, str) else value
 
-def calculate_gpm(stock):
-    try:
-        financials = stock.financials
-        if financials.empty: return -1.0
-        
-        gross_profit = financials.loc['Gross Profit'].iloc[0]
-        revenue = financials.loc['Total Revenue'].iloc[0]
-        return gross_profit / revenue if revenue > 0 else -1.0
-    except:
-        return -1.0
+# Capitaux propres : libellé actuel de yfinance, puis l'ancien
+EQUITY_LABELS = ('Stockholders Equity', 'Total Stockholder Equity')
 
-def calculate_de_ratio(stock):
-    try:
-        balance = stock.balance_sheet
-        if balance.empty: raise ValueError
-        
-        debt = balance.loc['Total Debt'].iloc[0] if 'Total Debt' in balance.index else get_safe_float(stock.info, 'totalDebt', 0.0)
-        equity = balance.loc['Total Stockholder Equity'].iloc[0] if 'Total Stockholder Equity' in balance.index else get_safe_float(stock.info, 'totalStockholderEquity', -1.0)
-        
-        return debt / equity if equity > 0 else 9999.0
-    except:
-        debt = get_safe_float(stock.info, 'totalDebt', 0.0)
-        equity = get_safe_float(stock.info, 'totalStockholderEquity', -1.0)
-        return debt / equity if equity > 0 else 9999.0
+# Seuls libellés lus dans les états financiers yfinance
+STATEMENT_LABELS = ['Net Income', 'Gross Profit', 'Total Revenue', 'Total Debt', *EQUITY_LABELS]
+
+def statement_rows(df):
+    """Convertit un état financier en (tableau numpy, {libellé: ligne}) pour un accès direct."""
+    # get_indexer exige des libellés uniques ; en cas de doublon, la dernière ligne
+    # l'emporte, comme avec l'ancien dictionnaire {libellé: ligne}
+    if not df.index.is_unique: df = df[~df.index.duplicated(keep='last')]
+    rows = df.index.get_indexer(STATEMENT_LABELS) # une seule résolution, -1 si absent
+    return df.to_numpy(), {label: i for label, i in zip(STATEMENT_LABELS, rows) if i >= 0}
+
+def statement_value(statement, *labels):
+    """Valeur la plus récente du premier libellé présent, None si aucun (sans exception)."""
+    values, rows = statement
+    if values.size == 0: return None
+    for label in labels:
+        if label in rows: return float(values[rows[label], 0]) # float natif, sérialisable
+    return None
+
+def calculate_roe(financials, balance):
+    net_income = statement_value(financials, 'Net Income')
+    equity = statement_value(balance, *EQUITY_LABELS)
+    if net_income is None or equity is None or not equity > 0: return -1.0
+    return net_income / equity
+
+def calculate_gpm(financials):
+    gross_profit = statement_value(financials, 'Gross Profit')
+    revenue = statement_value(financials, 'Total Revenue')
+    if gross_profit is None or revenue is None or not revenue > 0: return -1.0
+    return gross_profit / revenue
+
+def calculate_de_ratio(balance, info):
+    debt = statement_value(balance, 'Total Debt')
+    if debt is None: debt = get_safe_float(info, 'totalDebt', 0.0)
+    equity = statement_value(balance, *EQUITY_LABELS)
+    if equity is None: equity = get_safe_float(info, 'totalStockholderEquity', -1.0)
+    return debt / equity if equity > 0 else 9999.0
 
 # --- 2. RÉCUPÉRATION WIKIPEDIA (VERSION ANTI-BOT) ---
 
+# Session partagée : une seule connexion TLS vers Wikipedia, réutilisée (keep-alive)
+wiki_session = requests.Session()
+wiki_session.headers["User-Agent"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+def disk_cache(ttl):
+    """Mémorise le résultat (liste JSON) sur disque, par arguments, pendant ttl secondes."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = hashlib.sha1(repr(args).encode()).hexdigest()
+            path = os.path.join(CACHE_DIR, f"{key}.json")
+            try:
+                if os.path.getmtime(path) > time.time() - ttl:
+                    with open(path, "r") as f:
+                        return json.load(f)
+            except (OSError, ValueError):
+                pass
+
+            result = func(*args)
+            if result: # On ne mémorise pas un échec de scraping
+                try:
+                    os.makedirs(CACHE_DIR, exist_ok=True)
+                    with open(path, "w") as f:
+                        json.dump(result, f)
+                except OSError:
+                    pass
+            return result
+        return wrapper
+    return decorator
+
+@disk_cache(WIKI_CACHE_TTL)
 def get_tickers_from_wiki(url, table_index, col_names, suffix=""):
-    """Utilise requests avec un User-Agent pour éviter l'erreur 403 Forbidden."""
+    """Utilise une session requests avec un User-Agent pour éviter l'erreur 403 Forbidden."""
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        r = requests.get(url, headers=headers)
+        r = wiki_session.get(url)
         r.raise_for_status() 
         
-        dfs = pd.read_html(r.text, header=0)
-        if not dfs or len(dfs) <= table_index: return []
-        df = dfs[table_index]
+        # XPath direct sur la seule colonne utile, sans construire de DataFrame.
+        # Numérotation identique à pd.read_html (pour les index de WIKI_SOURCES) :
+        # les tableaux sans texte et ceux masqués (display:none) ne comptent pas.
+        tables = [
+            t for t in lxml.html.fromstring(r.content).xpath('//table[.//text()[normalize-space()]]')
+            if 'display:none' not in t.get('style', '').replace(' ', '')
+        ]
+        if len(tables) <= table_index: return []
+        rows = tables[table_index].xpath('./tr | ./thead/tr | ./tbody/tr')
+        if not rows: return []
         
-        target_col = next((c for c in col_names if c in df.columns), None)
-        if target_col:
-            tickers = [str(t).replace('.', '-') + suffix for t in df[target_col].tolist() if pd.notna(t)]
-            return tickers
-        return []
-    except Exception as e:
+        header = [c.text_content().strip() for c in rows[0].xpath('./th | ./td')]
+        col = next((header.index(c) for c in col_names if c in header), None)
+        if col is None: return []
+        
+        cells = (row.xpath('./th | ./td') for row in rows[1:])
+        symbols = (c[col].text_content().strip() for c in cells if len(c) > col)
+        return [t.replace('.', '-').upper() + suffix for t in symbols if t]
+    except Exception:
+        logger.debug("%s : échec du scraping", url, exc_info=True)
         return []
 
-def get_all_global_tickers():
-    print("--- Récupération des Tickers Mondiaux ---")
-    tickers = []
-    
+# Indices scrapés : (url, index du tableau, colonnes candidates, suffixe Yahoo)
+WIKI_SOURCES = [
     # USA
-    tickers.extend(get_tickers_from_wiki('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies', 0, ['Symbol']))
-    tickers.extend(get_tickers_from_wiki('https://en.wikipedia.org/wiki/Nasdaq-100', 4, ['Symbol', 'Ticker']))
+    ('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies', 0, ['Symbol'], ""),
+    ('https://en.wikipedia.org/wiki/Nasdaq-100', 4, ['Symbol', 'Ticker'], ""),
     # Russell 2000 (Pour plus de couverture US)
-    tickers.extend(get_tickers_from_wiki('https://en.wikipedia.org/wiki/Russell_2000_Index', 1, ['Company'], ""))
-
+    ('https://en.wikipedia.org/wiki/Russell_2000_Index', 1, ['Company'], ""),
     # Europe
-    tickers.extend(get_tickers_from_wiki('https://en.wikipedia.org/wiki/CAC_40', 4, ['Ticker'], ".PA"))
-    tickers.extend(get_tickers_from_wiki('https://en.wikipedia.org/wiki/DAX', 4, ['Ticker'], ".DE"))
-    tickers.extend(get_tickers_from_wiki('https://en.wikipedia.org/wiki/FTSE_100_Index', 4, ['Ticker'], ".L"))
-    
-    # Liste Manuelle / Autres
-    manual_list = ["7203.T", "6758.T", "9984.T", "NESN.SW", "NOVN.SW", "ROG.SW", "RY.TO", "TD.TO", "ENB.TO", "BHP.AX", "CBA.AX", "0700.HK", "9988.HK", "AAPL", "MSFT", "TTE.PA"]
-    tickers.extend(manual_list)
+    ('https://en.wikipedia.org/wiki/CAC_40', 4, ['Ticker'], ".PA"),
+    ('https://en.wikipedia.org/wiki/DAX', 4, ['Ticker'], ".DE"),
+    ('https://en.wikipedia.org/wiki/FTSE_100_Index', 4, ['Ticker'], ".L"),
+]
+
+# Liste Manuelle / Autres
+MANUAL_TICKERS = ["7203.T", "6758.T", "9984.T", "NESN.SW", "NOVN.SW", "ROG.SW", "RY.TO", "TD.TO", "ENB.TO", "BHP.AX", "CBA.AX", "0700.HK", "9988.HK", "AAPL", "MSFT", "TTE.PA"]
+
+async def scrape_wiki_sources():
+    """Scrape tous les indices en parallèle : durée du plus lent et non plus de la somme."""
+    lists = await asyncio.gather(*(asyncio.to_thread(get_tickers_from_wiki, *src) for src in WIKI_SOURCES))
+    return [t for tickers in lists for t in tickers] # gather garde l'ordre de WIKI_SOURCES
+
+def get_all_global_tickers():
+    logger.info("--- Récupération des Tickers Mondiaux ---")
+    tickers = asyncio.run(scrape_wiki_sources())
+    tickers.extend(MANUAL_TICKERS)
     
-    unique_tickers = list(set(tickers))
-    print(f"--- Total Tickers uniques trouvés : {len(unique_tickers)} ---")
+    # Dédoublonnage en gardant l'ordre : le S&P 500 passe en premier
+    unique_tickers = list(dict.fromkeys(t for t in tickers if t))
+    logger.info("--- Total Tickers uniques trouvés : %d ---", len(unique_tickers))
     return unique_tickers
 
 # --- 3. ANALYSE ET SEGMENTATION ---
 
-def process_ticker(ticker):
+def passes_pre_check(sector, pe, filters):
+    """Secteur admis et P/E dans la borne : seules ces actions justifient les états financiers."""
+    return sector not in filters.excluded_sectors and pe is not None and 0 < pe < filters.max_pe
+
+def process_ticker(ticker, filters=BUFFETT_FILTERS):
+    """Récupère les fondamentaux bruts d'une action ; le filtrage se fait dans screen()."""
     try:
         stock = yf.Ticker(ticker)
         info = stock.info
@@ -124,32 +237,206 @@ def process_ticker(ticker):
         if price <= 0: return None
 
         sector = info.get('sector', 'N/A')
-        if sector in EXCLUDED_SECTORS: return None
 
+        # Les 4 ratios sont déjà dans la réponse quoteSummary de stock.info :
+        # les états financiers (2 requêtes de plus) ne servent qu'en secours.
         pe = get_safe_float(info, 'trailingPE', 9999.0)
-        roe = calculate_roe(stock)
-        gpm = calculate_gpm(stock)
-        de = calculate_de_ratio(stock)
-
-        ok_pe = (0 < pe < 25) # CRITÈRE P/E < 25
-        ok_roe = (roe > 0.15)
-        ok_gpm = (gpm > 0.20)
-        ok_de = (de < 1.0) or (sector in EXEMPTED_DEBT_SECTORS)
-
-        if ok_pe and ok_roe and ok_gpm and ok_de:
-            name = info.get('longName', ticker)
-            currency = info.get('currency', 'USD')
-            tag = "Valeur d'Or"
-            if sector in EXEMPTED_DEBT_SECTORS: tag += f" (Dette: {sector})"
-            
+        roe = get_safe_float(info, 'returnOnEquity', None)
+        gpm = get_safe_float(info, 'grossMargins', None)
+        de = get_safe_float(info, 'debtToEquity', None) # Yahoo le donne en %
+        if de is not None: de /= 100
+
+        # Rejet immédiat (secteur, P/E) avant toute requête sur les états financiers.
+        # La ligne est tout de même renvoyée pour être mise en cache.
+        if passes_pre_check(sector, pe, filters):
+            # Chaque état financier n'est téléchargé qu'une fois, et seulement si besoin
+            financials = statement_rows(stock.financials) if roe is None or gpm is None else None
+            balance = statement_rows(stock.balance_sheet) if roe is None or de is None else None
+            if roe is None: roe = calculate_roe(financials, balance)
+            if gpm is None: gpm = calculate_gpm(financials)
+            if de is None: de = calculate_de_ratio(balance, info)
+
+        return {
+            "symbol": ticker, "name": info.get('longName', ticker), "sector": sector,
+            "pe": pe, "roe": roe, "gpm": gpm, "de_ratio": de,
+            "price": price, "currency": info.get('currency', 'USD')
+        }
+    except Exception:
+        logger.debug("%s : échec de l'analyse", ticker, exc_info=True)
+        return None
+
+def download_prices(symbols):
+    """Derniers cours de clôture par symbole, téléchargés par lots avec yf.download."""
+    prices = {}
+    for i in range(0, len(symbols), PRICE_BATCH):
+        try:
+            closes = yf.download(
+                symbols[i:i + PRICE_BATCH], period="5d", auto_adjust=False,
+                threads=True, progress=False
+            )["Close"]
+            last = closes.ffill().iloc[-1]
+        except Exception:
+            logger.debug("Échec du téléchargement des cours", exc_info=True)
+            continue
+        prices.update((sym, float(p)) for sym, p in last.items() if p > 0)
+    return prices
+
+def open_fundamentals_db():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    db = sqlite3.connect(FUNDAMENTALS_DB)
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS fundamentals (symbol TEXT PRIMARY KEY, name TEXT, sector TEXT, "
+        "pe REAL, roe REAL, gpm REAL, de_ratio REAL, currency TEXT, fetched_at REAL)"
+    )
+    return db
+
+def load_fundamentals(tickers, filters=BUFFETT_FILTERS):
+    """Fondamentaux en cache depuis moins de FUNDAMENTALS_TTL, indexés par symbole.
+
+    Une ligne mise en cache par un run aux critères plus stricts peut avoir des ratios
+    NULL (états financiers non lus) : elle est ignorée si elle passe le pré-filtre de filters.
+    """
+    wanted = set(tickers)
+    try:
+        with closing(open_fundamentals_db()) as db:
+            cursor = db.execute(
+                f"SELECT {', '.join(FUNDAMENTAL_FIELDS)} FROM fundamentals WHERE fetched_at > ?",
+                (time.time() - FUNDAMENTALS_TTL,)
+            )
+            rows = (dict(zip(FUNDAMENTAL_FIELDS, r)) for r in cursor if r[0] in wanted)
             return {
-                "symbol": ticker, "name": name, "sector": sector,
-                "pe": round(pe, 2), "roe": round(roe*100, 2),
-                "gpm": round(gpm*100, 2), "de_ratio": round(de, 2),
-                "price": round(price, 2), "currency": currency, "tag": tag
+                row['symbol']: row for row in rows
+                if not (None in (row['roe'], row['gpm'], row['de_ratio'])
+                        and passes_pre_check(row['sector'], row['pe'], filters))
             }
-    except:
-        return None
+    except (OSError, sqlite3.Error):
+        return {}
+
+def pre_filter(tickers, filters):
+    """Écarte, sans aucun appel réseau, les tickers dont le secteur exclu est connu d'un run précédent."""
+    try:
+        with closing(open_fundamentals_db()) as db:
+            cursor = db.execute(
+                "SELECT symbol, sector FROM fundamentals WHERE fetched_at > ?",
+                (time.time() - SECTOR_TTL,)
+            )
+            excluded = {sym for sym, sector in cursor if sector in filters.excluded_sectors}
+    except (OSError, sqlite3.Error):
+        return tickers
+    return [t for t in tickers if t not in excluded]
+
+def save_fundamentals(df):
+    rows = df[list(FUNDAMENTAL_FIELDS)].assign(fetched_at=time.time())
+    try:
+        with closing(open_fundamentals_db()) as db, db:
+            db.executemany(
+                "INSERT OR REPLACE INTO fundamentals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows.itertuples(index=False, name=None)
+            )
+    except (OSError, sqlite3.Error):
+        pass
+
+async def scan(tickers, spool, filters):
+    """Lance process_ticker en parallèle ; chaque résultat est récupéré dès son arrivée.
+
+    Chaque ligne est écrite aussitôt dans spool (NDJSON) au lieu d'être gardée en mémoire.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(MAX_WORKERS)
+    analyse = functools.partial(process_ticker, filters=filters)
+
+    async def fetch(ticker):
+        async with slots:
+            started = asyncio.Event()
+
+            def job():
+                loop.call_soon_threadsafe(started.set)
+                return analyse(ticker)
+
+            # Le délai ne court qu'à partir du démarrage effectif dans un thread : une action
+            # en file derrière des threads bloqués n'est pas abandonnée sans avoir été tentée.
+            running = loop.run_in_executor(executor, job)
+            await started.wait()
+            try:
+                return await asyncio.wait_for(running, TICKER_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.debug("%s : abandon après %d s", ticker, TICKER_TIMEOUT)
+                return None
+
+    # yfinance est synchrone (session curl_cffi + crumb Yahoo) : l'appel réseau
+    # reste dans un thread, asyncio ne fait qu'orchestrer la file d'attente.
+    # Un thread abandonné ne peut pas être interrompu : le pool a donc de la marge
+    # pour que les actions suivantes ne restent pas bloquées derrière lui.
+    # TICKER_TIMEOUT borne l'attente par action, pas la durée totale : scan() rend la
+    # main sans attendre les threads abandonnés, mais la sortie du processus les attend.
+    executor = ThreadPoolExecutor(max_workers=2 * MAX_WORKERS)
+    try:
+        for fut in asyncio.as_completed([fetch(t) for t in tickers]):
+            row = await fut
+            if row: spool.write(orjson.dumps(row, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n")
+    finally:
+        executor.shutdown(wait=False)
+
+def read_spool(spool):
+    """Relit le fichier NDJSON rempli par scan() en un seul DataFrame."""
+    if spool.tell() == 0: return pd.DataFrame(columns=FUNDAMENTAL_FIELDS + ("price",))
+    spool.seek(0)
+    return pd.read_json(spool, lines=True, dtype=False, precise_float=True)
+
+def to_record(row):
+    """Construit l'entrée data.json d'une action retenue (colonnes déjà mises en forme par screen())."""
+    return {
+        "symbol": row['symbol'], "name": row['name'], "sector": canon(row['sector']),
+        "pe": row['pe'], "roe": row['roe'], "gpm": row['gpm'], "de_ratio": row['de_ratio'],
+        "price": row['price'], "currency": canon(row['currency']), "tag": canon(row['tag'])
+    }
+
+def screen_mask(pe, roe, gpm, de, excluded, exempt, filters):
+    """Noyau numérique des filtres Buffett : tableaux float64 (NaN = rejet) et masques de secteur."""
+    ok_pe = (pe > 0) & (pe < filters.max_pe)
+    ok_de = (de < filters.max_de) | exempt
+    return ok_pe & (roe > filters.min_roe) & (gpm > filters.min_gpm) & ok_de & ~excluded
+
+def screen(df, filters=BUFFETT_FILTERS):
+    """Applique les 4 filtres Buffett en une passe vectorisée, résultat trié par P/E."""
+    if df.empty: return []
+    # Les ratios absents (None, ou NULL venant du cache) deviennent NaN et échouent aux filtres
+    ratios = ['pe', 'roe', 'gpm', 'de_ratio']
+    df[ratios] = df[ratios].astype(float)
+
+    # Un code entier par secteur : chaque nom distinct n'est testé qu'une fois,
+    # puis les masques par action sont de simples indexations de tableau.
+    codes, sectors = pd.factorize(df['sector'], use_na_sentinel=False)
+    exempt = sectors.isin(filters.exempted_debt_sectors)[codes]
+    mask = screen_mask(
+        *(df[c].to_numpy() for c in ratios),
+        excluded=sectors.isin(filters.excluded_sectors)[codes],
+        exempt=exempt,
+        filters=filters
+    )
+    selected = df[mask].copy()
+    # Mise en forme (ROE et marge en %, 2 décimales, tag) colonne par colonne
+    selected['tag'] = np.where(exempt[mask], "Valeur d'Or (Dette: " + selected['sector'] + ")", "Valeur d'Or")
+    selected[['roe', 'gpm']] *= 100
+    displayed = ratios + ['price']
+    selected[displayed] = selected[displayed].round(2)
+    return [to_record(r) for r in selected.sort_values('pe').to_dict(orient='records')]
+
+def run_analysis(tickers, filters=BUFFETT_FILTERS):
+    """Analyse une liste de tickers et renvoie les actions retenues, triées par P/E."""
+    tickers = pre_filter(tickers, filters)
+    cached = load_fundamentals(tickers, filters)
+    # Actions en cache : seul le cours est rafraîchi, par lots. Celles dont le cours
+    # n'a pas pu être obtenu (lot en échec, rate-limit) repassent par l'analyse complète.
+    prices = download_prices(list(cached))
+    cached = {sym: row for sym, row in cached.items() if sym in prices}
+    with tempfile.TemporaryFile() as spool:
+        for sym, row in cached.items():
+            spool.write(orjson.dumps(dict(row, price=prices[sym]), option=orjson.OPT_SERIALIZE_NUMPY) + b"\n")
+        asyncio.run(scan([t for t in tickers if t not in cached], spool, filters))
+        fundamentals = read_spool(spool)
+    save_fundamentals(fundamentals[~fundamentals['symbol'].isin(list(cached))])
+    return screen(fundamentals, filters)
 
 def run():
     try:
@@ -181,25 +468,22 @@ def run():
                     if t and t[0].upper() in allowed_letters
                 ]
             except:
-                print(f"Format de segment non reconnu: {segment}. Analyse complète.")
+                logger.warning("Format de segment non reconnu: %s. Analyse complète.", segment)
                 filtered_tickers = tickers
                 segment = "A-Z" # Revient à l'analyse complète pour ne pas planter la fusion
 
         # Sécurité : Limite à 2000 actions par job pour les très gros segments
         tickers_to_process = filtered_tickers[:2000] 
 
-        print(f"Analyse du segment {segment}. Actions à traiter: {len(tickers_to_process)}")
+        logger.info("Analyse du segment %s. Actions à traiter: %d", segment, len(tickers_to_process))
         
         # 3. Exécution de l'Analyse
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            results = list(executor.map(process_ticker, tickers_to_process))
-
-        data = sorted([r for r in results if r], key=lambda x: x['pe'])
+        data = run_analysis(tickers_to_process)
         
         # 4. Chargement des anciennes données et ajout des nouvelles (fusion)
         try:
-            with open("data.json", "r") as f:
-                existing_data = json.load(f)
+            with open("data.json", "rb") as f:
+                existing_data = orjson.loads(f.read())
             
             # Ne fusionne que si allowed_letters est définie (i.e. si ce n'est pas A-Z)
             if allowed_letters is not None:
@@ -209,28 +493,33 @@ def run():
                     if not (item['symbol'] and item['symbol'][0].upper() in allowed_letters)
                 ]
                 
-                # 4.2. Ajout des nouvelles valeurs du segment
+                # 4.2. Ajout des nouvelles valeurs du segment, puis tri global par P/E
                 existing_data['data'].extend(data)
                 data = existing_data['data']
+                data.sort(key=itemgetter('pe'))
         
-        except (FileNotFoundError, json.JSONDecodeError):
-            print("Création d'un nouveau fichier data.json.")
+        except (FileNotFoundError, orjson.JSONDecodeError):
+            logger.info("Création d'un nouveau fichier data.json.")
         
         # 5. Sauvegarde
         final = {
-            "last_updated": datetime.datetime.utcnow().strftime("%d/%m/%Y %H:%M GMT"),
+            "last_updated": datetime.datetime.now(datetime.timezone.utc).strftime("%d/%m/%Y %H:%M GMT"),
             "count": len(data),
             "data": data
         }
         
-        with open("data.json", "w") as f:
-            json.dump(final, f)
-        print(f"Succès du segment {segment}. {len(data)} actions totales après fusion.")
+        with open("data.json", "wb") as f:
+            f.write(orjson.dumps(final, option=orjson.OPT_SERIALIZE_NUMPY))
+        logger.info("Succès du segment %s. %d actions totales après fusion.", segment, len(data))
         
     except Exception:
-        traceback.print_exc()
+        logger.exception("Échec du screener")
         sys.exit(1)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # SCREENER_DEBUG=1 pour le détail par action (désactivé par défaut : aucun formatage).
+    # Seul ce module passe en DEBUG, pas yfinance / urllib3 / curl_cffi.
+    if os.environ.get("SCREENER_DEBUG"): logger.setLevel(logging.DEBUG)
     pd.options.mode.chained_assignment = None
     run()
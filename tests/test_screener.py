@@ -0,0 +1,149 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import screener
+
+
+class FakeTicker:
+    """Action sans returnOnEquity dans info : force le secours par les états financiers."""
+
+    def __init__(self, ticker):
+        self.info = {
+            'currentPrice': 10.0, 'sector': 'Financial Services', 'trailingPE': 8.0,
+            'grossMargins': 0.5, 'longName': 'Fake Bank', 'currency': 'EUR'
+        }
+        self.financials = pd.DataFrame({'2024': [20.0, 50.0, 100.0]}, index=['Net Income', 'Gross Profit', 'Total Revenue'])
+        self.balance_sheet = pd.DataFrame({'2024': [100.0, 300.0]}, index=['Stockholders Equity', 'Total Debt'])
+
+
+def test_statement_fallback_row_reaches_spool(monkeypatch):
+    monkeypatch.setattr(screener.yf, 'Ticker', FakeTicker)
+
+    row = screener.process_ticker('FAKE.PA')
+    assert row['roe'] == 0.2 and row['de_ratio'] == 3.0
+
+    with tempfile.TemporaryFile() as spool:
+        asyncio.run(screener.scan(['FAKE.PA'], spool, screener.BUFFETT_FILTERS))
+        fundamentals = screener.read_spool(spool)
+
+    assert fundamentals['symbol'].tolist() == ['FAKE.PA']
+    assert fundamentals['roe'].tolist() == [0.2]
+
+
+def test_cached_ticker_without_price_is_rescanned(monkeypatch, tmp_path):
+    monkeypatch.setattr(screener, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(screener, 'FUNDAMENTALS_DB', str(tmp_path / 'fundamentals.db'))
+    monkeypatch.setattr(screener.yf, 'Ticker', FakeTicker)
+    monkeypatch.setattr(screener, 'download_prices', lambda symbols: {})
+
+    screener.save_fundamentals(pd.DataFrame([screener.process_ticker('FAKE.PA')]))
+    result = screener.run_analysis(['FAKE.PA'])
+
+    assert [r['symbol'] for r in result] == ['FAKE.PA']
+
+
+WIKI_PAGE = b"""<html><body>
+<table class="infobox"><tr><th>Index</th><td>CAC 40</td></tr></table>
+<table><tr><td> </td></tr></table>
+<table style="display: none"><tr><th>Ticker</th></tr><tr><td>HIDDEN</td></tr></table>
+<table class="wikitable"><thead><tr><th>Company</th><th>Ticker</th></tr></thead>
+<tbody><tr><td>Air Liquide</td><td>AI</td></tr><tr><td>BNP Paribas</td><td>BNP</td></tr></tbody></table>
+</body></html>"""
+
+
+class FakeResponse:
+    content = WIKI_PAGE
+
+    def raise_for_status(self):
+        pass
+
+
+def test_wiki_table_index_matches_read_html(monkeypatch):
+    monkeypatch.setattr(screener.wiki_session, 'get', lambda url: FakeResponse())
+
+    # Même index que celui que pd.read_html donne au tableau des composants
+    assert screener.get_tickers_from_wiki.__wrapped__('url', 1, ['Ticker'], '.PA') == ['AI.PA', 'BNP.PA']
+
+
+def test_queued_ticker_is_not_timed_out_before_it_starts(monkeypatch):
+    # Deux threads bloqués occupent tout le pool (2 * MAX_WORKERS) : la troisième
+    # action attend dans l'exécuteur, ce temps ne doit pas compter dans son délai.
+    monkeypatch.setattr(screener, "MAX_WORKERS", 1)
+    monkeypatch.setattr(screener, "TICKER_TIMEOUT", 0.2)
+
+    def slow_or_fast(ticker, filters):
+        if ticker != "FAST": time.sleep(1.0)
+        return {"symbol": ticker}
+
+    monkeypatch.setattr(screener, "process_ticker", slow_or_fast)
+    with tempfile.TemporaryFile() as spool:
+        asyncio.run(screener.scan(["HUNG1", "HUNG2", "FAST"], spool, screener.BUFFETT_FILTERS))
+        rows = screener.read_spool(spool)
+    assert list(rows["symbol"]) == ["FAST"]
+
+
+class ExpensiveFakeTicker(FakeTicker):
+    """P/E 30 : rejeté d'emblée par les critères Buffett, états financiers non lus."""
+
+    def __init__(self, ticker):
+        super().__init__(ticker)
+        self.info['trailingPE'] = 30.0
+
+
+def test_cached_row_without_ratios_is_rescanned_for_wider_spec(monkeypatch, tmp_path):
+    monkeypatch.setattr(screener, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(screener, 'FUNDAMENTALS_DB', str(tmp_path / 'fundamentals.db'))
+    monkeypatch.setattr(screener.yf, 'Ticker', ExpensiveFakeTicker)
+    monkeypatch.setattr(screener, 'download_prices', lambda symbols: {s: 10.0 for s in symbols})
+
+    assert screener.run_analysis(['FAKE.PA']) == []
+    result = screener.run_analysis(['FAKE.PA'], screener.BUFFETT_FILTERS._replace(max_pe=40))
+
+    assert [r['symbol'] for r in result] == ['FAKE.PA']
+
+
+def test_statement_with_duplicated_label_is_read():
+    df = pd.DataFrame({'2024': [1.0, 20.0, 30.0]}, index=['Net Income', 'Net Income', 'Total Revenue'])
+
+    assert screener.statement_value(screener.statement_rows(df), 'Net Income') == 20.0
+    assert screener.statement_value(screener.statement_rows(df), 'Total Revenue') == 30.0
+
+
+def fundamentals_row(symbol, sector, pe, roe, gpm, de):
+    return {
+        'symbol': symbol, 'name': symbol, 'sector': sector, 'pe': pe, 'roe': roe,
+        'gpm': gpm, 'de_ratio': de, 'currency': 'EUR', 'price': 42.123
+    }
+
+
+def test_screen_filters_formats_and_sorts():
+    df = pd.DataFrame([
+        fundamentals_row('BANK', 'Financial Services', 12.0, 0.18, 0.5, 3.2), # dette exemptée
+        fundamentals_row('CONSO', 'Consumer Defensive', 20.123, 0.25678, 0.41234, 0.5),
+        fundamentals_row('NOSECTOR', None, 8.0, 0.3, 0.3, 0.2),
+        fundamentals_row('TECH', 'Technology', 10.0, 0.3, 0.6, 0.1), # secteur exclu
+        fundamentals_row('NOROE', 'Consumer Defensive', 10.0, None, 0.6, 0.1), # NULL du cache
+        fundamentals_row('DEBT', 'Consumer Defensive', 10.0, 0.3, 0.6, 1.5),
+    ])
+
+    result = screener.screen(df)
+
+    assert [r['symbol'] for r in result] == ['NOSECTOR', 'BANK', 'CONSO']
+    assert [r['tag'] for r in result] == [
+        "Valeur d'Or", "Valeur d'Or (Dette: Financial Services)", "Valeur d'Or"
+    ]
+    conso = result[2]
+    assert (conso['pe'], conso['roe'], conso['gpm'], conso['price']) == (20.12, 25.68, 41.23, 42.12)
+    assert result[1]['de_ratio'] == 3.2
+
+
+def test_concurrency_setting_is_parsed_defensively(monkeypatch):
+    for raw, expected in [('', 16), ('abc', 16), ('0', 1), ('-3', 1), (' 8 ', 8)]:
+        monkeypatch.setenv('SCREENER_CONCURRENCY', raw)
+        assert screener.env_workers('SCREENER_CONCURRENCY', 16) == expected